@@ -2,18 +2,32 @@
 
 import os
 import shutil
-import subprocess
-import datetime
 import sys
 import collections
+import concurrent.futures
+import errno
+import functools
+import heapq
 import json
-import openai
-from dotenv import load_dotenv # For securely loading API key
+import queue
+import sqlite3
+import threading
+import time
+try:
+    import orjson # Optional: serializes tool results several times faster than json
+except ImportError:
+    orjson = None
+
+import _fastwalk_darwin
+from _fastwalk_darwin import KIND_DIR, KIND_FILE, KIND_LINK, KIND_OTHER
 
 # --- Configuration ---
+# The current user's home directory, resolved once.
+HOME = os.path.expanduser('~')
+
 # Directories to scan for overall size analysis.
 SCAN_DIRS_FOR_SIZE = [
-    os.path.expanduser('~'),  # Your home directory
+    HOME,  # Your home directory
     '/Library/Caches',
     '/private/var/folders', # Common temporary files location
     '/tmp',
@@ -21,7 +35,7 @@ SCAN_DIRS_FOR_SIZE = [
 
 # Directories to specifically scan for large/old/cache/temp files.
 SCAN_DIRS_FOR_SUGGESTIONS = [
-    os.path.expanduser('~'),
+    HOME,
     '/Library/Caches',
     '/private/var/folders',
     '/tmp',
@@ -33,96 +47,585 @@ MIN_LARGE_FILE_SIZE_MB = 100
 # Files older than this many days will be flagged as "old".
 OLD_FILE_DAYS = 90
 
-# Keywords/patterns to identify potential cache, temp, or log files.
-CACHE_PATTERNS = ['cache', '.cache', 'chromium', 'vscode', 'npm', 'yarn', 'brew', 'library/developer/xcode/deriveddata']
-TEMP_PATTERNS = ['temp', '.tmp', 'temporary', 'downloads', 'trash', '.Trash']
-LOG_PATTERNS = ['log', '.log', 'logs']
+# Path components (lowercase, matched exactly) and file name suffixes that identify
+# potential cache, temp, or log files. Whole components avoid false positives such as
+# 'catalog' or 'music.cached.db' that plain substring matching would flag.
+CACHE_COMPONENTS = frozenset({
+    'cache', 'caches', '.cache', '__pycache__', 'code cache', 'gpucache',
+    'chromium', 'vscode', '.vscode', 'npm', '.npm', '_cacache', 'yarn', '.yarn',
+    'homebrew', 'deriveddata',
+})
+CACHE_SUFFIXES = ('.cache',)
+TEMP_COMPONENTS = frozenset({
+    'temp', 'tmp', '.tmp', 'temporary', 'temporaryitems', 'downloads', 'trash', '.trash',
+})
+TEMP_SUFFIXES = ('.tmp', '.temp')
+LOG_COMPONENTS = frozenset({'log', 'logs'})
+LOG_SUFFIXES = ('.log',)
+# Components starting or ending with these also mark caches, such as Chromium's CacheStorage,
+# ShaderCache, GrShaderCache and DawnCache, or Firefox's cache2.
+CACHE_COMPONENT_PREFIXES = ('cache',)
+CACHE_COMPONENT_ENDINGS = ('cache',)
+# Rotated logs such as system.log.0.gz or foo.log.1 are logs too: a trailing rotation
+# number and one of these compression suffixes are ignored when checking LOG_SUFFIXES.
+ROTATED_LOG_COMPRESSION_SUFFIXES = ('.gz', '.bz2', '.xz', '.zip')
+
+# Directory names the suggestion scan never descends into. App sandboxes and shared
+# app group data are often restricted and not relevant for manual cleanup unless
+# specifically targeting an app's data; iCloud Drive and other cloud-synced folders may
+# not be stored locally. Their files still count towards sizes by the space they occupy.
+PRUNE_BASENAMES = frozenset({
+    'Containers',
+    'Group Containers',
+    'Mobile Documents',
+    'CloudStorage',
+    '.Trash',
+    'tmp',
+})
+
+# Paths that are never walked, not even for their size. /System and /Volumes hold the
+# OS and other mounted disks.
+SKIP_PATHS = frozenset({'/System', '/Volumes'})
+
+# Only the largest files of each suggestion category are kept, so memory use stays
+# bounded however many cache/temp files the scan finds.
+MAX_SUGGESTIONS_PER_CATEGORY = 50
+
+# Set DISK_ANALYSER_SCAN_CACHE=1 to cache scan results for each directory between runs.
+# A directory whose mtime hasn't changed then reuses its cached results instead of being
+# listed again. Off by default: a file that grows in place (a disk image or a log) doesn't
+# change its directory's mtime, so its size can be reported as it was up to
+# SCAN_CACHE_MAX_AGE_HOURS ago.
+SCAN_CACHE_ENABLED = os.getenv('DISK_ANALYSER_SCAN_CACHE') == '1'
+SCAN_CACHE_PATH = os.path.join(HOME, '.cache', 'mac-disk-analyser', 'cache.sqlite')
+# Cached results are only trusted for this long.
+SCAN_CACHE_MAX_AGE_HOURS = 24
+# Cache entries for directories that haven't been seen for this many days are deleted.
+SCAN_CACHE_EXPIRY_DAYS = 30
+
+# Number of largest suggested files shown for each root as soon as it finishes scanning (0 to turn previews off).
+SUGGESTION_PREVIEW_COUNT = 5
+
+# Number of threads used to walk directory trees. Scanning is bound by filesystem
+# metadata latency rather than CPU, so use more threads than cores.
+SCAN_WORKERS = min(32, (os.cpu_count() or 4) * 2)
 
 # Number of top directories to display by default (can be overridden by agent)
 DEFAULT_TOP_N_DIRS = 15
 
+# Once the conversation history is estimated to exceed this many tokens, all but the most
+# recent turns are replaced by a summary, so requests don't grow slower with every question.
+HISTORY_TOKEN_BUDGET = 6000
+# Number of most recent question-and-answer turns that are always kept word for word.
+HISTORY_KEEP_TURNS = 2
+# Tool results from older turns are cut to this many characters.
+OLD_TOOL_RESULT_CHARS = 500
+# Older turns are only summarized once they hold at least this many tokens; summarizing
+# less would cost an extra request per question while saving next to nothing.
+HISTORY_MIN_SUMMARY_TOKENS = 1000
+
+# Seconds to wait for the OpenAI API before giving up on a request.
+OPENAI_TIMEOUT_SECONDS = 30.0
+
 # --- Global Data Storage (Populated by initial scan) ---
 _disk_summary_data = {}
 _directory_sizes_data = [] # List of (path, size_bytes) tuples
-_suggested_files_data = collections.defaultdict(list) # Dict of {suggestion_type: [(filepath, size)]}
+_suggested_files_data = collections.defaultdict(list) # Dict of {suggestion_type: list of the largest (size, filepath) tuples, largest first}
+_suggestion_counts = collections.Counter() # Dict of {suggestion_type: number of matching files found}
+_PATH_INDEX = [] # List of (lowercased path, path) tuples for every path in the scan results, built once for search_paths
 
 # --- Helper Functions (from previous script, adapted to return data) ---
 
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
 def convert_bytes_to_human_readable(num_bytes):
     """Converts a number of bytes into a human-readable string (e.g., 10GB, 500MB)."""
     if num_bytes is None:
         return "N/A"
-    num_bytes = float(num_bytes)
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB', 'PB']:
-        if num_bytes < 1024.0:
-            return f"{num_bytes:.2f} {unit}"
-        num_bytes /= 1024.0
-    return f"{num_bytes:.2f} PB"
-
-def convert_human_readable_to_bytes(size_str):
-    """Converts a human-readable size string (e.g., '1.2G', '500M') to bytes."""
-    size_str = size_str.strip().upper()
-    if not size_str:
-        return 0
-
-    # Extract number part
-    num_str = ""
-    unit_str = ""
-    for char in size_str:
-        if char.isdigit() or char == '.':
-            num_str += char
-        else:
-            unit_str += char
+    # Each unit is 2**10 times the previous one, so the bit length picks the unit directly.
+    unit = min(max(int(num_bytes).bit_length() - 1, 0) // 10, len(_SIZE_UNITS) - 1)
+    return f"{num_bytes / (1 << (10 * unit)):.2f} {_SIZE_UNITS[unit]}"
+
+# Categories from most to least specific, paired with the components and suffixes that identify them.
+_CATEGORY_PATTERNS = [
+    ("Cache", CACHE_COMPONENTS, CACHE_SUFFIXES),
+    ("Temporary", TEMP_COMPONENTS, TEMP_SUFFIXES),
+    ("Log", LOG_COMPONENTS, LOG_SUFFIXES),
+]
+_CATEGORIES = tuple(category for category, _, _ in _CATEGORY_PATTERNS) + ("Other",)
+_CATEGORY_PRIORITY = {category: rank for rank, category in enumerate(_CATEGORIES)}
+# Every known component mapped to the rank of its most specific category, so each component
+# is classified with one dict lookup.
+_COMPONENT_RANKS = {
+    component: rank
+    for rank, (_, components, _) in reversed(list(enumerate(_CATEGORY_PATTERNS)))
+    for component in components
+}
+_ALL_SUFFIXES = tuple(suffix for _, _, suffixes in _CATEGORY_PATTERNS for suffix in suffixes)
+_LOG_RANK = _CATEGORY_PRIORITY["Log"]
+_ROTATED_LOG_ENDINGS = ROTATED_LOG_COMPRESSION_SUFFIXES + tuple('0123456789')
+
+def _suggestion_type(is_large, is_old, file_type):
+    """Returns the sorted suggestion type tuple for a file, or None if it isn't worth suggesting."""
+    labels = []
+    if is_large:
+        labels.append("Large")
+    if is_old:
+        labels.append("Old")
+    if file_type != "Other":
+        labels.append(file_type)
+    return tuple(sorted(labels)) or None
+
+# Every outcome of the per-file checks mapped to its suggestion type, so the scan loop does
+# one dict lookup per file instead of building and sorting a list.
+_SUGGESTION_TYPES = {
+    (is_large, is_old, file_type): _suggestion_type(is_large, is_old, file_type)
+    for is_large in (False, True) for is_old in (False, True) for file_type in _CATEGORIES
+}
 
-    try:
-        num = float(num_str)
-    except ValueError:
-        return 0 # Cannot parse number
-
-    if 'K' in unit_str:
-        return num * 1024
-    elif 'M' in unit_str:
-        return num * 1024**2
-    elif 'G' in unit_str:
-        return num * 1024**3
-    elif 'T' in unit_str:
-        return num * 1024**4
-    elif 'P' in unit_str:
-        return num * 1024**5
-    elif 'B' in unit_str: # Explicit bytes or no unit
-        return num
-    return num # Default to bytes if no unit found
-
-def is_old_file(filepath, days_threshold):
-    """Checks if a file is older than a given number of days."""
-    try:
-        mtime = os.path.getmtime(filepath)
-        file_age_seconds = datetime.datetime.now().timestamp() - mtime
-        file_age_days = file_age_seconds / (24 * 3600)
-        return file_age_days > days_threshold
-    except (OSError, FileNotFoundError):
-        return False
+def _component_rank(component):
+    """Returns the rank of the most specific category a single lowercase path component names."""
+    if component.startswith(CACHE_COMPONENT_PREFIXES) or component.endswith(CACHE_COMPONENT_ENDINGS):
+        return _CATEGORY_PRIORITY["Cache"]
+    return _COMPONENT_RANKS.get(component, len(_CATEGORY_PATTERNS))
+
+def _is_rotated_log(name):
+    """Returns True for lowercase rotated log names such as system.log.0.gz or foo.log.1."""
+    for suffix in ROTATED_LOG_COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    base, dot, number = name.rpartition('.')
+    if dot and number.isdigit():
+        name = base
+    return name.endswith(LOG_SUFFIXES)
 
 def classify_file(filepath):
-    """Classifies a file based on its path for suggestion purposes."""
-    filepath_lower = filepath.lower()
-    if any(p in filepath_lower for p in CACHE_PATTERNS):
-        return "Cache"
-    if any(p in filepath_lower for p in TEMP_PATTERNS):
-        return "Temporary"
-    if any(p in filepath_lower for p in LOG_PATTERNS):
-        return "Log"
-    return "Other"
+    """Classifies a file based on its path components and name for suggestion purposes."""
+    lowered = filepath.lower()
+    rank = min(map(_component_rank, lowered.split(os.sep)))
+    if rank and lowered.endswith(_ALL_SUFFIXES):
+        rank = min(rank, next(suffix_rank for suffix_rank, (_, _, suffixes) in enumerate(_CATEGORY_PATTERNS)
+                              if lowered.endswith(suffixes)))
+    if rank > _LOG_RANK and lowered.endswith(_ROTATED_LOG_ENDINGS) and _is_rotated_log(lowered):
+        rank = _LOG_RANK
+    return _CATEGORIES[rank]
+
+def _component_type(path):
+    """Classifies `path` by its components alone, ignoring any file name suffix."""
+    return _CATEGORIES[min(map(_component_rank, path.lower().split(os.sep)))]
+
+def _more_specific(type_a, type_b):
+    """Returns whichever of two categories takes precedence."""
+    return type_a if _CATEGORY_PRIORITY[type_a] <= _CATEGORY_PRIORITY[type_b] else type_b
+
+def _printable(path):
+    """Returns `path` with undecodable bytes (surrogate-escaped by os.fsdecode) shown as \\xNN escapes."""
+    return os.fsencode(path).decode('utf-8', 'backslashreplace')
+
+def _log(message):
+    """Prints a progress line immediately rather than when stdout's buffer fills."""
+    print(message, flush=True)
+
+def _push_bounded(heap, item):
+    """Pushes `item` onto min-heap `heap`, keeping only the MAX_SUGGESTIONS_PER_CATEGORY largest items."""
+    if len(heap) < MAX_SUGGESTIONS_PER_CATEGORY:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+def _scandir_list(directory):
+    """Portable fallback for _fastwalk_darwin.list_dir built on os.scandir and one lstat per non-directory."""
+    entries = []
+    # Errors opening or reading the directory propagate to the caller, which skips the
+    # whole directory. The type checks use the cached d_type where the filesystem provides
+    # one, but fall back to an lstat on filesystems that report DT_UNKNOWN, so they can
+    # fail just like the stat call for an entry that disappears mid-listing.
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    entries.append((entry.name, KIND_DIR, 0, 0.0, 0, 0, 1))
+                    continue
+                if entry.is_symlink():
+                    entries.append((entry.name, KIND_LINK, 0, 0.0, 0, 0, 1)) # Both scans skip symlinks, so don't stat them
+                    continue
+                kind = KIND_FILE if entry.is_file(follow_symlinks=False) else KIND_OTHER
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue # Deleted between readdir and lstat, common under /private/var/folders
+            # Count the blocks actually allocated, like du, so sparse disk images and files evicted
+            # to iCloud aren't reported at their apparent size.
+            entries.append((entry.name, kind, st.st_blocks * 512, st.st_mtime, st.st_dev, st.st_ino, st.st_nlink))
+    return entries
+
+def _list_dir(directory):
+    """
+    Lists `directory` as (name, kind, size, mtime, dev, ino, nlink) tuples without following symlinks,
+    where size is the space allocated on disk. Only the name and kind are meaningful for directories and symlinks.
+    Uses batched getattrlistbulk calls on macOS and falls back to os.scandir elsewhere, or on
+    filesystems that don't support it. Raises OSError if the directory can't be read.
+    """
+    if _fastwalk_darwin.AVAILABLE:
+        try:
+            return _fastwalk_darwin.list_dir(directory)
+        except OSError as e:
+            if e.errno not in (errno.ENOTSUP, errno.EINVAL):
+                raise
+    return _scandir_list(directory)
+
+class _SeenInodes:
+    """Thread-safe record of hardlinked files already counted, keyed by (st_dev, st_ino)."""
+
+    def __init__(self):
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def first_sighting(self, dev, ino):
+        """Returns True the first time a (dev, ino) pair is seen and False afterwards."""
+        key = (dev, ino)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+
+class _ScanCache:
+    """
+    Per-directory scan results persisted in SQLite between runs, keyed by (path, mtime).
+    All usable rows are loaded up front, so scanning threads only ever read a dict; new
+    results are written back in one transaction by save(). With no path, or after any SQLite
+    or filesystem error, the cache is disabled rather than failing the scan.
+    """
 
-# --- Data Collection Functions (Populate global data) ---
+    SCHEMA_VERSION = 2 # Bumped when sizes switched from apparent to allocated bytes
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.lookups = 0
+        self._counts_lock = threading.Lock() # lookup() runs on every scanning thread
+        self._rows = {}
+        self._stored = [] # (path, mtime_ns, suggest, payload) rows to write back
+        self._reused = [] # Paths whose cached rows were used this run
+        self._enabled = False
+        if path is None:
+            return
+        now = time.time()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with sqlite3.connect(path) as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS settings (fingerprint TEXT)")
+                conn.execute("""CREATE TABLE IF NOT EXISTS dirs (
+                    path TEXT PRIMARY KEY, mtime_ns INTEGER, suggest INTEGER,
+                    payload TEXT, scanned_at REAL, last_seen REAL)""")
+                row = conn.execute("SELECT fingerprint FROM settings").fetchone()
+                if row is None or row[0] != self._fingerprint():
+                    # Results computed under different thresholds or patterns can't be reused.
+                    conn.execute("DELETE FROM dirs")
+                    conn.execute("DELETE FROM settings")
+                    conn.execute("INSERT INTO settings VALUES (?)", (self._fingerprint(),))
+                for dir_path, mtime_ns, suggest, payload in conn.execute(
+                        "SELECT path, mtime_ns, suggest, payload FROM dirs WHERE scanned_at >= ?",
+                        (now - SCAN_CACHE_MAX_AGE_HOURS * 3600,)):
+                    self._rows[dir_path] = (mtime_ns, bool(suggest), payload)
+            self._enabled = True
+        except (sqlite3.Error, OSError):
+            self._rows = {}
+
+    @classmethod
+    def _fingerprint(cls):
+        """Returns a string that changes whenever a setting that shapes cached results does."""
+        return json.dumps([
+            cls.SCHEMA_VERSION, MIN_LARGE_FILE_SIZE_MB, OLD_FILE_DAYS, MAX_SUGGESTIONS_PER_CATEGORY,
+            sorted(CACHE_COMPONENTS), CACHE_SUFFIXES, sorted(TEMP_COMPONENTS), TEMP_SUFFIXES,
+            sorted(LOG_COMPONENTS), LOG_SUFFIXES, CACHE_COMPONENT_PREFIXES, CACHE_COMPONENT_ENDINGS,
+            ROTATED_LOG_COMPRESSION_SUFFIXES,
+        ])
+
+    def lookup(self, directory, mtime_ns, suggest, prefix):
+        """
+        Returns the cached `(size, dir_heaps, dir_counts, subdir_names)` listing of `directory`,
+        or None if there is no fresh entry for its current mtime.
+        """
+        with self._counts_lock:
+            self.lookups += 1
+        row = self._rows.get(directory)
+        if row is None or row[0] != mtime_ns or row[1] != suggest:
+            return None
+        try:
+            size, subdir_names, categories = json.loads(row[2])
+            size = int(size)
+            if not all(isinstance(name, str) for name in subdir_names):
+                raise TypeError("subdirectory names must be strings")
+            dir_heaps = collections.defaultdict(list)
+            dir_counts = collections.Counter()
+            for s_type_list, count, heap in categories:
+                s_type_tuple = tuple(s_type_list)
+                dir_counts[s_type_tuple] = int(count)
+                dir_heaps[s_type_tuple] = [(int(file_size), prefix + name) for file_size, name in heap] # Still in heap order
+        except (ValueError, TypeError):
+            return None # A malformed row is a miss; storing this run's listing replaces it
+        with self._counts_lock:
+            self.hits += 1
+        self._reused.append(directory)
+        return size, dir_heaps, dir_counts, subdir_names
+
+    def store(self, directory, mtime_ns, suggest, prefix, listing):
+        """Queues the `(size, dir_heaps, dir_counts, subdir_names)` listing of `directory` to be saved."""
+        if not self._enabled or time.time() - mtime_ns / 1e9 < 2:
+            return # A directory changed within the last moment may change again within the same mtime tick
+        try:
+            directory.encode('utf-8')
+        except UnicodeEncodeError:
+            return # Undecodable names (surrogate-escaped by os.fsdecode) can't be stored as SQLite text
+        size, dir_heaps, dir_counts, subdir_names = listing
+        categories = [
+            [list(s_type_tuple), dir_counts[s_type_tuple], [[file_size, path[len(prefix):]] for file_size, path in heap]]
+            for s_type_tuple, heap in dir_heaps.items()
+        ]
+        self._stored.append((directory, mtime_ns, suggest, json.dumps([size, subdir_names, categories])))
+
+    def save(self):
+        """Writes back this run's results and drops entries for directories not seen in a long time."""
+        if not self._enabled:
+            return
+        now = time.time()
+        try:
+            with sqlite3.connect(self.path) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?)",
+                    [(path, mtime_ns, int(suggest), payload, now, now) for path, mtime_ns, suggest, payload in self._stored])
+                conn.executemany("UPDATE dirs SET last_seen = ? WHERE path = ?", [(now, path) for path in self._reused])
+                conn.execute("DELETE FROM dirs WHERE last_seen < ?", (now - SCAN_CACHE_EXPIRY_DAYS * 86400,))
+        except (sqlite3.Error, UnicodeError):
+            pass # The cache is only an optimisation; the next run simply rescans
+
+def _walk_parallel(roots, scan_dir, on_root_done=None):
+    """
+    Walks directory trees concurrently on SCAN_WORKERS threads.
+    `roots` is a list of `(root, task)` pairs. `scan_dir(root, task)` is called once per directory
+    and must return a `(result, subtasks)` tuple; the subtasks are queued for scanning as part
+    of the same root. Yields `(root, result)` pairs on the calling thread as directories complete,
+    and calls `on_root_done(root)` there once the last directory under a root has been yielded.
+    """
+    results = queue.Queue()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        def submit(root, task):
+            future = executor.submit(scan_dir, root, task)
+            future.add_done_callback(lambda f: results.put((root, f)))
+
+        pending = collections.Counter() # Directories queued or scanning, per root
+        for root, task in roots:
+            submit(root, task)
+            pending[root] += 1
+        try:
+            while pending:
+                root, future = results.get()
+                result, subtasks = future.result()
+                for subtask in subtasks:
+                    submit(root, subtask)
+                pending[root] += len(subtasks) - 1
+                yield root, result
+                if not pending[root]:
+                    del pending[root]
+                    if on_root_done is not None:
+                        on_root_done(root)
+        except BaseException:
+            # Interrupted (Ctrl-C) or abandoned: drop queued directories so only those being listed finish.
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+class SuggestionsPrinter:
+    """
+    Collects suggestions as directories are scanned and previews each root's largest
+    suggested files as soon as that root is finished, rather than after the whole scan.
+    """
 
-def run_initial_scan():
-    """Performs the initial disk scan and populates global data."""
-    print("--- Initial Disk Scan ---")
-    print("This may take a few moments depending on your disk size and speed.")
-    print("Scanning...")
+    def __init__(self, preview_count=SUGGESTION_PREVIEW_COUNT):
+        self.preview_count = preview_count
+        self.heaps = collections.defaultdict(list) # {suggestion_type: bounded min-heap of (size, filepath)}
+        self.counts = collections.Counter()
+        self._root_previews = collections.defaultdict(list) # {root: bounded min-heap of (size, filepath, suggestion_type)}
+        self._root_counts = collections.Counter()
+
+    def add(self, root, dir_heaps, dir_counts):
+        """Merges one directory's suggestions, found while scanning `root`."""
+        self.counts.update(dir_counts)
+        self._root_counts[root] += sum(dir_counts.values())
+        preview = self._root_previews[root] if self.preview_count > 0 else None
+        for s_type_tuple, dir_heap in dir_heaps.items():
+            heap = self.heaps[s_type_tuple]
+            for size, path in dir_heap:
+                _push_bounded(heap, (size, path))
+                if preview is None:
+                    continue
+                if len(preview) < self.preview_count:
+                    heapq.heappush(preview, (size, path, s_type_tuple))
+                elif size > preview[0][0]:
+                    heapq.heapreplace(preview, (size, path, s_type_tuple))
+
+    def flush_for_root(self, root):
+        """Prints the largest suggested files found under `root`, which must have finished scanning."""
+        count = self._root_counts.pop(root, 0)
+        preview = self._root_previews.pop(root, [])
+        if not count or self.preview_count <= 0:
+            return
+        lines = [f"    {_printable(root)}: {count} potential files, largest:"]
+        for size, path, s_type_tuple in sorted(preview, reverse=True):
+            lines.append(f"      {convert_bytes_to_human_readable(size):>10}  {_printable(path)} ({' '.join(s_type_tuple)})")
+        try:
+            _log("\n".join(lines))
+        except (OSError, ValueError):
+            pass # The preview is only a courtesy; never let it cost the scan results
+
+def _scan_trees(size_roots, suggestion_roots, min_size_bytes, cache, printer):
+    """
+    Walks all roots once, both sizing them and looking for files worth reviewing.
+    Directories unchanged since they were recorded in `cache` reuse their cached results,
+    and suggestions are handed to `printer` as each directory completes.
+    Returns a `(dir_totals, heaps, counts)` tuple:
+      - dir_totals: {path: total size in bytes} for each of `size_roots` and each of their
+        immediate subdirectories, like `du -d 1`.
+      - heaps: {suggestion_type: min-heap of the MAX_SUGGESTIONS_PER_CATEGORY largest
+        (size, filepath) tuples} for files under `suggestion_roots`.
+      - counts: a Counter of how many files matched each suggestion type.
+    Symlinks are not followed, other filesystems mounted below a root are not entered, and
+    hardlinked files and directories reachable twice within a root are only counted once.
+    """
+    # Both per-file checks reduce to one comparison against a threshold fixed for the run.
+    old_cutoff = time.time() - OLD_FILE_DAYS * 86400
+    inodes = _SeenInodes()
+    # Each root is walked like `find -xdev`, and a directory reached twice within it (through
+    # a firmlink or bind mount) is only scanned once. Roots are deduplicated separately so
+    # that a root nested inside another still gets its own total.
+    root_devs = {}
+    visited_dirs = {} # {root: set of directory inode numbers}; one device per root, so st_ino suffices
+    visited_lock = threading.Lock()
+
+    def first_visit(root, st):
+        """Returns True if the directory `st` belongs to the root's filesystem and hasn't been scanned yet."""
+        if st.st_dev != root_devs[root]:
+            return False
+        visited = visited_dirs[root]
+        with visited_lock:
+            if st.st_ino in visited:
+                return False
+            visited.add(st.st_ino)
+            return True
+
+    def list_and_classify(directory, prefix, suggest, path_type):
+        """
+        Lists `directory`, whose components classify as `path_type`, returning
+        `(size, dir_heaps, dir_counts, subdir_names)` and whether the listing may be cached.
+        """
+        size = 0
+        # Reduce each directory to its own top files per category before handing it back,
+        # so a directory with many thousands of cache files never materialises all of them.
+        dir_heaps = collections.defaultdict(list)
+        dir_counts = collections.Counter()
+        subdir_names = []
+        # Reusing a listing would skip the hardlink checks, so directories with any
+        # multiply-linked file are always listed afresh.
+        cacheable = True
+        suggestion_types = _SUGGESTION_TYPES
+        entries = _list_dir(directory)
+        # All files here share the directory's path, whose components were classified on the
+        # way down, so only the directory's own name and then each file's name need checking.
+        dir_type = "Other"
+        if suggest:
+            dir_type = _more_specific(path_type, classify_file(os.path.basename(directory)))
+        for name, kind, file_size, mtime, dev, ino, nlink in entries:
+            if kind == KIND_DIR: # Symlinks are never listed as directories, which avoids loops and double counting
+                subdir_names.append(name)
+                continue
+            if kind == KIND_LINK:
+                continue # The target is either elsewhere in the scan or outside it; don't count it twice
+            # Only files with several links can be seen twice; the rest stay out of the set.
+            if nlink > 1:
+                cacheable = False
+                if not inodes.first_sighting(dev, ino):
+                    continue
+            size += file_size
+            if not suggest:
+                continue
+
+            file_type = dir_type
+            if dir_type != "Cache":
+                file_type = _more_specific(dir_type, classify_file(name))
+            s_type_tuple = suggestion_types[file_size >= min_size_bytes, mtime < old_cutoff, file_type]
+            if s_type_tuple is None:
+                continue
+            dir_counts[s_type_tuple] += 1
+            # Child paths are built by concatenation, and only for files that can make the top-K.
+            heap = dir_heaps[s_type_tuple]
+            if len(heap) < MAX_SUGGESTIONS_PER_CATEGORY or file_size >= heap[0][0]:
+                _push_bounded(heap, (file_size, prefix + name))
+        return (size, dir_heaps, dir_counts, subdir_names), cacheable
+
+    def scan_dir(root, task):
+        # A task is (directory, count_size, suggest, child, path_type), where child is the root's
+        # immediate subdirectory the directory lies in, or None for the root itself, and path_type
+        # classifies the directory's path components. Pruned subtrees of a sized root are still
+        # walked for their size, but nothing in them is suggested. Directories that aren't listed
+        # report no child, so a skipped subdirectory doesn't show up as an empty one.
+        directory, count_size, suggest, child, path_type = task
+        prefix = directory if directory.endswith(os.sep) else directory + os.sep
+        try:
+            st = os.stat(directory)
+            if child is None:
+                root_devs[root] = st.st_dev # Subtasks are only queued once the root itself is done
+            if not first_visit(root, st):
+                return (None, 0, {}, collections.Counter()), []
+            mtime_ns = st.st_mtime_ns
+            listing = cache.lookup(directory, mtime_ns, suggest, prefix)
+            if listing is None:
+                listing, cacheable = list_and_classify(directory, prefix, suggest, path_type)
+                if cacheable:
+                    cache.store(directory, mtime_ns, suggest, prefix, listing)
+        except OSError:
+            return (None, 0, {}, collections.Counter()), [] # Permission denied or directory removed mid-scan
+        size, dir_heaps, dir_counts, subdir_names = listing
+
+        subtasks = []
+        for name in subdir_names:
+            subdir = prefix + name
+            if subdir in SKIP_PATHS:
+                continue
+            # Prune directories that are likely permission-denied or irrelevant for suggestions
+            # before they are ever opened, unless they still need to be sized.
+            if suggest and (name in PRUNE_BASENAMES or name.startswith(('.', '$'))): # Skip hidden system folders, Windows tmp, etc.
+                if count_size:
+                    subtasks.append((subdir, True, False, child or subdir, "Other"))
+                continue
+            subdir_type = path_type
+            if suggest and path_type != "Cache":
+                subdir_type = _more_specific(path_type, _component_type(name))
+            subtasks.append((subdir, count_size, suggest, child or subdir, subdir_type))
+        return (child, size, dir_heaps, dir_counts), subtasks
+
+    # Roots listed in both configurations are walked once.
+    roots = [(root, (root, root in size_roots, root in suggestion_roots, None, _component_type(root)))
+             for root in dict.fromkeys(size_roots + suggestion_roots)]
+    visited_dirs.update((root, set()) for root, _ in roots)
+    dir_totals = dict.fromkeys(size_roots, 0)
+    child_totals = collections.Counter()
+    for root, (child, size, dir_heaps, dir_counts) in _walk_parallel(roots, scan_dir, printer.flush_for_root):
+        if root in dir_totals:
+            dir_totals[root] += size
+            if child is not None:
+                child_totals[child] += size
+        if dir_counts:
+            printer.add(root, dir_heaps, dir_counts)
+    # A subdirectory that is also configured as a root already has its own total.
+    for child, size in child_totals.items():
+        dir_totals.setdefault(child, size)
+    return dir_totals, printer.heaps, printer.counts
+
+# --- Data Collection Functions (Populate global data) ---
 
-    # 1. Get Disk Summary
+def _collect_disk_summary():
+    """Populates the disk summary data."""
     try:
         total, used, free = shutil.disk_usage("/")
         _disk_summary_data.update({
@@ -131,96 +634,88 @@ def run_initial_scan():
             "free": free,
             "usage_percentage": used / total if total > 0 else 0
         })
-        print(f"  Disk Summary Collected: Used {convert_bytes_to_human_readable(used)}")
+        _log(f"  Disk Summary Collected: Used {convert_bytes_to_human_readable(used)}")
     except Exception as e:
-        print(f"  Error getting disk summary: {e}")
+        _log(f"  Error getting disk summary: {e}")
         _disk_summary_data.clear()
 
-    # 2. Get Top Directory Sizes
-    print(f"  Scanning top-level directories: {', '.join(SCAN_DIRS_FOR_SIZE)}")
-    dir_sizes = {}
+def _collect_scan_results():
+    """Populates the directory sizes and cleanup suggestions data."""
+    _log(f"  Scanning top-level directories: {', '.join(SCAN_DIRS_FOR_SIZE)}")
+    size_roots = []
     for path in SCAN_DIRS_FOR_SIZE:
         if not os.path.exists(path):
-            print(f"    Warning: Directory not found: {path}. Skipping.")
+            _log(f"    Warning: Directory not found: {path}. Skipping.")
             continue
-        try:
-            process = subprocess.run(
-                ['du', '-sh', path],
-                capture_output=True,
-                text=True,
-                check=True,
-                encoding='utf-8' # Ensure correct encoding for file paths
-            )
-            output = process.stdout.strip().split('\t')
-            if len(output) == 2:
-                size_str, dir_path = output
-                dir_sizes[dir_path] = convert_human_readable_to_bytes(size_str)
-            else:
-                print(f"    Warning: Could not parse du output for {path}: {output}")
-        except subprocess.CalledProcessError as e:
-            print(f"    Error running 'du' for {path}: {e.stderr.strip()}")
-        except Exception as e:
-            print(f"    An unexpected error occurred for {path}: {e}")
-
-    _directory_sizes_data.extend(sorted(dir_sizes.items(), key=lambda item: item[1], reverse=True))
-    print(f"  Top Directory Sizes Collected ({len(_directory_sizes_data)} entries).")
+        size_roots.append(path)
 
-    # 3. Find Large/Old/Cache/Temp Files for Suggestions
-    print(f"  Scanning for potential cleanup suggestions in: {', '.join(SCAN_DIRS_FOR_SUGGESTIONS)}")
+    _log(f"  Scanning for potential cleanup suggestions in: {', '.join(SCAN_DIRS_FOR_SUGGESTIONS)}")
     min_size_bytes = MIN_LARGE_FILE_SIZE_MB * 1024 * 1024
-
+    suggestion_roots = []
     for directory in SCAN_DIRS_FOR_SUGGESTIONS:
         if not os.path.exists(directory):
-            print(f"    Warning: Suggestion scan directory not found: {directory}. Skipping.")
+            _log(f"    Warning: Suggestion scan directory not found: {directory}. Skipping.")
             continue
-        # print(f"    Scanning {directory}...")
-        for root, dirs, files in os.walk(directory, followlinks=False): # Don't follow symlinks to avoid loops and double counting
-            # Prune directories that are likely permission-denied or irrelevant for this scan
-            dirs[:] = [d for d in dirs if not d.startswith(('.', '$')) and d != 'tmp'] # Skip hidden system folders, Windows tmp, etc.
-            if 'Library/Containers' in root and os.path.expanduser('~') in root:
-                # Many app sandboxes are in here, often restricted or not relevant for manual cleanup
-                # unless specifically targeting an app's data. Prune deep dives.
-                if 'Containers' in dirs: dirs.remove('Containers')
-            if '.Trash' in dirs: dirs.remove('.Trash') # handled by specific patterns
-
-
-            for name in files:
-                filepath = os.path.join(root, name)
-                try:
-                    file_size = os.path.getsize(filepath)
-
-                    is_large = file_size >= min_size_bytes
-                    is_old = is_old_file(filepath, OLD_FILE_DAYS)
-                    file_type = classify_file(filepath)
-
-                    if is_large or is_old or file_type != "Other":
-                        suggestion_type = []
-                        if is_large:
-                            suggestion_type.append("Large")
-                        if is_old:
-                            suggestion_type.append("Old")
-                        if file_type != "Other":
-                            suggestion_type.append(file_type)
-
-                        if suggestion_type:
-                            _suggested_files_data[tuple(sorted(suggestion_type))].append({"path": filepath, "size": file_size})
-
-                except PermissionError:
-                    pass # Silently skip permission errors for individual files
-                except FileNotFoundError:
-                    pass # File might have been deleted between os.walk and os.path.getsize
-                except OSError as e: # Catch other OS-related errors like invalid file names
-                    # print(f"    OS Error processing {filepath}: {e}")
-                    pass
-                except Exception as e:
-                    # print(f"    Error processing {filepath}: {e}")
-                    pass
-
-    print(f"  Cleanup Suggestions Collected ({sum(len(v) for v in _suggested_files_data.values())} potential files).")
+        suggestion_roots.append(directory)
+
+    dir_sizes = {}
+    try:
+        cache = _ScanCache(SCAN_CACHE_PATH if SCAN_CACHE_ENABLED else None)
+        dir_sizes, heaps, counts = _scan_trees(size_roots, suggestion_roots, min_size_bytes, cache, SuggestionsPrinter())
+        # The heaps are final once the scan is done, so sort them once here rather than on every query.
+        _suggested_files_data.update((s_type_tuple, sorted(heap, reverse=True)) for s_type_tuple, heap in heaps.items())
+        _suggestion_counts.update(counts)
+        cache.save()
+        if cache.hits:
+            _log(f"  Reused cached results for {cache.hits} of {cache.lookups} unchanged directories.")
+    except Exception as e:
+        _log(f"    An unexpected error occurred while scanning: {e}")
+
+    _directory_sizes_data.extend(sorted(dir_sizes.items(), key=lambda item: item[1], reverse=True))
+    _build_path_index()
+    _log(f"  Top Directory Sizes Collected ({len(_directory_sizes_data)} entries).")
+    _log(f"  Cleanup Suggestions Collected ({sum(_suggestion_counts.values())} potential files).")
+
+def _build_path_index():
+    """Lowercases every path in the scan results once, so each search is a plain substring scan."""
+    paths = [path for path, _ in _directory_sizes_data]
+    for items in _suggested_files_data.values():
+        paths.extend(path for _, path in items)
+    _PATH_INDEX.extend((path.lower(), path) for path in dict.fromkeys(paths))
+
+def run_initial_scan():
+    """Performs the initial disk scan and populates global data."""
+    print("--- Initial Disk Scan ---")
+    print("This may take a few moments depending on your disk size and speed.")
+    print("Scanning...")
+
+    # Both phases run on the main thread so Ctrl-C stops the scan straight away.
+    _collect_disk_summary()
+    _collect_scan_results()
+
     print("Initial scan complete. You can now ask questions.")
 
 # --- LLM Tools (Functions the AI agent can call) ---
 
+def _to_json(obj, indent=False):
+    """Serializes a tool result, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+        except orjson.JSONEncodeError:
+            pass # e.g. undecodable file names, which orjson rejects and json escapes
+    return json.dumps(obj, indent=2 if indent else None)
+
+@functools.lru_cache(maxsize=None)
+def _disk_summary_json():
+    """Formats the disk summary once; it doesn't change after the initial scan."""
+    return _to_json({
+        "total": convert_bytes_to_human_readable(_disk_summary_data.get("total")),
+        "used": convert_bytes_to_human_readable(_disk_summary_data.get("used")),
+        "free": convert_bytes_to_human_readable(_disk_summary_data.get("free")),
+        "usage_percentage": f"{_disk_summary_data.get('usage_percentage', 0):.2%}"
+    })
+
 def get_overall_disk_info():
     """
     Returns the overall disk usage information for the root partition,
@@ -228,12 +723,7 @@ def get_overall_disk_info():
     """
     if not _disk_summary_data:
         return "Disk summary data not available."
-    return json.dumps({
-        "total": convert_bytes_to_human_readable(_disk_summary_data.get("total")),
-        "used": convert_bytes_to_human_readable(_disk_summary_data.get("used")),
-        "free": convert_bytes_to_human_readable(_disk_summary_data.get("free")),
-        "usage_percentage": f"{_disk_summary_data.get('usage_percentage', 0):.2%}"
-    })
+    return _disk_summary_json()
 
 def get_top_n_directories(n: int = DEFAULT_TOP_N_DIRS):
     """
@@ -247,7 +737,13 @@ def get_top_n_directories(n: int = DEFAULT_TOP_N_DIRS):
         return "No directory size data available. Please ensure the initial scan completed successfully."
     top_dirs = [{"path": path, "size": convert_bytes_to_human_readable(size)}
                 for path, size in _directory_sizes_data[:n]]
-    return json.dumps(top_dirs)
+    return _to_json(top_dirs)
+
+@functools.lru_cache(maxsize=64)
+def _format_suggestions(s_type_tuple, limit):
+    """Formats the `limit` largest files of one category. Results are fixed after the scan, so they are cached."""
+    return [{"path": path, "size": convert_bytes_to_human_readable(size)}
+            for size, path in _suggested_files_data[s_type_tuple][:limit]]
 
 def get_suggested_files(suggestion_type: str = None, limit: int = 10):
     """
@@ -261,6 +757,7 @@ def get_suggested_files(suggestion_type: str = None, limit: int = 10):
                                          Example: "Large, Cache". Case-insensitive.
                                          Defaults to None (returns summary).
         limit (int): The maximum number of files to return per category. Defaults to 10.
+                     Only the MAX_SUGGESTIONS_PER_CATEGORY largest files are kept per category.
     Returns:
         A JSON string containing the suggestions.
     """
@@ -272,41 +769,31 @@ def get_suggested_files(suggestion_type: str = None, limit: int = 10):
     if suggestion_type:
         requested_types = [s.strip().capitalize() for s in suggestion_type.split(',')]
 
-    all_sorted_types = sorted(list(_suggested_files_data.keys()), key=lambda x: len(x), reverse=True)
-
-    for s_type_tuple in all_sorted_types:
-        s_type_name = " ".join(s_type_tuple)
-        if requested_types and not any(rt in s_type_name for rt in requested_types):
-            continue
-
-        items = sorted(_suggested_files_data[s_type_tuple], key=lambda x: x['size'], reverse=True)
-        formatted_items = []
-        for item in items[:limit]:
-            formatted_items.append({
-                "path": item['path'],
-                "size": convert_bytes_to_human_readable(item['size'])
-            })
-        results[s_type_name] = formatted_items
-
-    if not results and requested_types:
-        return f"No suggestions found for types: {suggestion_type}. Available types: {', '.join(set(t for types in _suggested_files_data.keys() for t in types))}"
-    elif not results:
-         return "No specific cleanup suggestions found based on current criteria."
-
-    # If no specific type was requested, provide a summary
+    # If no specific type was requested, provide a summary; no file lists need formatting for it
     if not requested_types:
         summary = {
             "summary": {
-                "total_suggestions": sum(len(v) for v in _suggested_files_data.values()),
+                "total_suggestions": sum(_suggestion_counts.values()),
                 "categories_found": {
-                    " ".join(k): len(v) for k, v in _suggested_files_data.items()
+                    " ".join(k): count for k, count in _suggestion_counts.items()
                 }
             },
             "details_hint": "You can ask for specific categories like 'Large', 'Old', 'Cache', 'Temporary', 'Log', or combinations like 'Large, Old'."
         }
-        return json.dumps(summary, indent=2)
+        return _to_json(summary, indent=True)
+
+    all_sorted_types = sorted(list(_suggested_files_data.keys()), key=lambda x: len(x), reverse=True)
+
+    for s_type_tuple in all_sorted_types:
+        s_type_name = " ".join(s_type_tuple)
+        if not any(rt in s_type_name for rt in requested_types):
+            continue
+        results[s_type_name] = _format_suggestions(s_type_tuple, limit)
 
-    return json.dumps(results, indent=2)
+    if not results:
+        return f"No suggestions found for types: {suggestion_type}. Available types: {', '.join(set(t for types in _suggested_files_data.keys() for t in types))}"
+
+    return _to_json(results, indent=True)
 
 
 def search_paths(query: str):
@@ -318,20 +805,11 @@ def search_paths(query: str):
         A JSON string of a list of paths found.
     """
     query_lower = query.lower()
-    found_paths = set()
-
-    for path, _ in _directory_sizes_data:
-        if query_lower in path.lower():
-            found_paths.add(path)
-
-    for s_type_tuple in _suggested_files_data:
-        for item in _suggested_files_data[s_type_tuple]:
-            if query_lower in item['path'].lower():
-                found_paths.add(item['path'])
+    found_paths = [path for path_lower, path in _PATH_INDEX if query_lower in path_lower]
 
     if not found_paths:
         return f"No paths found containing '{query}' in scan results."
-    return json.dumps(list(found_paths)[:20]) # Limit to 20 to avoid overwhelming
+    return _to_json(found_paths[:20]) # Limit to 20 to avoid overwhelming
 
 # --- LLM Tool Definitions for OpenAI API ---
 
@@ -379,7 +857,7 @@ TOOLS = [
                     },
                     "limit": {
                         "type": "integer",
-                        "description": "The maximum number of files to return per category. Defaults to 10."
+                        "description": f"The maximum number of files to return per category. Defaults to 10, at most {MAX_SUGGESTIONS_PER_CATEGORY}."
                     }
                 },
                 "required": [] # suggestion_type and limit are optional
@@ -415,7 +893,74 @@ AVAILABLE_FUNCTIONS = {
 
 # --- Main Agent Logic ---
 
+def _message_field(message, field):
+    """Reads a field from a history entry, which is either a dict or an API message object."""
+    if isinstance(message, dict):
+        return message.get(field)
+    return getattr(message, field, None)
+
+def _estimate_tokens(messages):
+    """Roughly estimates the tokens in `messages`, at about four characters per token."""
+    chars = 0
+    for message in messages:
+        chars += len(_message_field(message, "content") or "")
+        for tool_call in _message_field(message, "tool_calls") or []:
+            chars += len(tool_call.function.arguments)
+    return chars // 4
+
+def _compact_history(client, messages):
+    """
+    Keeps the conversation history in `messages` within HISTORY_TOKEN_BUDGET. Tool results
+    from before the last HISTORY_KEEP_TURNS turns are truncated, and if that isn't enough,
+    those turns are replaced by a model-written summary, provided they hold at least
+    HISTORY_MIN_SUMMARY_TOKENS. Edits `messages` in place.
+    """
+    # Cut only at the start of a turn, so tool results are never separated from the call requesting them.
+    turn_starts = [i for i, message in enumerate(messages) if _message_field(message, "role") == "user"]
+    if len(turn_starts) <= HISTORY_KEEP_TURNS:
+        return
+    cut = turn_starts[-HISTORY_KEEP_TURNS]
+
+    for message in messages[1:cut]:
+        if isinstance(message, dict) and message.get("role") == "tool" and len(message["content"]) > OLD_TOOL_RESULT_CHARS:
+            message["content"] = message["content"][:OLD_TOOL_RESULT_CHARS] + " [truncated]"
+    if _estimate_tokens(messages) <= HISTORY_TOKEN_BUDGET:
+        return
+    # The recent turns alone may exceed the budget; re-summarizing a summary wouldn't help.
+    older = messages[1:cut]
+    if len(older) == 1 and _message_field(older[0], "role") == "system":
+        return
+    if _estimate_tokens(older) < HISTORY_MIN_SUMMARY_TOKENS:
+        return
+
+    import openai # Already loaded by run_conversation
+
+    transcript = "\n".join(
+        f"{_message_field(message, 'role')}: {_message_field(message, 'content')}"
+        for message in messages[1:cut] if _message_field(message, "content")
+    )
+    try:
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo-0125",
+            messages=[
+                {"role": "system", "content": (
+                    "Summarize this conversation between a user and a disk usage assistant in a few sentences. "
+                    "Keep any paths, sizes and findings the user may refer back to."
+                )},
+                {"role": "user", "content": transcript},
+            ],
+        )
+    except openai.OpenAIError:
+        return # Keep the full history; the next question will try again
+    summary = response.choices[0].message.content
+    messages[1:cut] = [{"role": "system", "content": f"Conversation so far: {summary}"}]
+
 def run_conversation():
+    # The OpenAI client pulls in a large dependency tree, so it's only imported once the
+    # scan is done rather than delaying the start of the scan.
+    import openai
+    from dotenv import load_dotenv # For securely loading API key
+
     # Load API key from environment variable or .env file
     load_dotenv()
     api_key = os.getenv("OPENAI_API_KEY")
@@ -436,7 +981,7 @@ def run_conversation():
 
     openai.api_key = api_key
 
-    client = openai.OpenAI(api_key=api_key)
+    client = openai.OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT_SECONDS)
 
     messages = [
         {"role": "system", "content": (
@@ -470,6 +1015,7 @@ def run_conversation():
         messages.append({"role": "user", "content": user_query})
 
         try:
+            _compact_history(client, messages)
             response = client.chat.completions.create(
                 model="gpt-3.5-turbo-0125", # You can try "gpt-4" or other models if available
                 messages=messages,
@@ -517,9 +1063,17 @@ def run_conversation():
                 second_response = client.chat.completions.create(
                     model="gpt-3.5-turbo-0125",
                     messages=messages,
+                    stream=True, # Print the answer as it is generated rather than all at once at the end
                 )  # get a new response from the model that can summarize the tool's output
-                print(second_response.choices[0].message.content)
-                messages.append(second_response.choices[0].message) # Add agent's response to history
+                answer_parts = []
+                for chunk in second_response:
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    if content:
+                        sys.stdout.write(content)
+                        sys.stdout.flush()
+                        answer_parts.append(content)
+                print()
+                messages.append({"role": "assistant", "content": "".join(answer_parts)}) # Add agent's response to history
 
             else:
                 print(response_message.content)
@@ -550,6 +1104,9 @@ if __name__ == "__main__":
     print("             without 'sudo' to avoid scanning system-critical directories, which are")
     print("             usually not the source of user-related disk space issues.")
     print("Data freshness: All data is based on the initial scan. Restart the script for fresh data.")
+    if SCAN_CACHE_ENABLED:
+        print(f"                Scan cache on: results are reused from {SCAN_CACHE_PATH}, so sizes")
+        print(f"                may be up to {SCAN_CACHE_MAX_AGE_HOURS} hours old.")
 
 
     run_initial_scan()